@@ -3,6 +3,7 @@ import datetime
 import os
 import tempfile
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from fpdf import FPDF
 import plotly.io as pio
 
@@ -21,9 +22,6 @@ import modules.dem_analysis as dem_analysis
 import modules.time_series as time_series
 import modules.rainfall as rainfall  # New Module Added
 
-# --------------------------------------------------
-# 1. Professional PDF Reporting Engine
-# --------------------------------------------------
 # --------------------------------------------------
 # 1. Advanced Executive Reporting Engine (GeoSense Pro)
 # --------------------------------------------------
@@ -189,6 +187,8 @@ if 'stats' not in st.session_state:
     st.session_state.stats = {}
 if 'chart_img' not in st.session_state:
     st.session_state.chart_img = None
+if 'ts_prefetch' not in st.session_state:
+    st.session_state.ts_prefetch = {}
 
 if authenticate_gee():
     # --- Sidebar Controls ---
@@ -216,6 +216,16 @@ if authenticate_gee():
     
     enable_ts = st.sidebar.checkbox("📉 Enable Time Series Trend Analysis")
 
+    # Map UI modules to Time Series parameters
+    ts_mapping = {
+        "Precipitation & Rainfall (NASA GPM)": "Rainfall",
+        "Air Quality Monitoring (Sentinel-5P)": "Air Quality",
+        "Land Surface Temperature (LST)": "Temp",
+        "Spectral Indices & Environmental Metrics": "Vegetation"
+    }
+    ts_target = ts_mapping.get(analysis_type, "Vegetation")
+    ts_key = (ts_target, target_city, selected_year)
+
     # --- Main Header ---
     roi = get_country_roi(target_city)
     st.markdown(f"""
@@ -236,24 +246,40 @@ if authenticate_gee():
                 # Clear previous state
                 st.session_state.chart_img = None
                 
-                # Routing to specific module
-                if analysis_type == "Precipitation & Rainfall (NASA GPM)":
-                    results = rainfall.run(target_city, roi, selected_year, selected_month)
-                elif analysis_type == "Terrain Analysis (DEM / Slope / Aspect)":
-                    results = dem_analysis.run(target_city, roi, selected_year, selected_month)
-                elif analysis_type == "Flood Mapping & Risk (SAR)":
-                    results = flood_mapping.run(target_city, roi, selected_year, selected_month)
-                elif analysis_type == "Spectral Indices & Environmental Metrics":
-                    results = rs_indices.run(target_city, roi, selected_year, selected_month)
-                elif analysis_type == "Air Quality Monitoring (Sentinel-5P)":
-                    results = air_quality.run(target_city, roi, selected_year, selected_month, "NO2")
-                elif analysis_type == "Land Surface Temperature (LST)":
-                    results = lst.run(target_city, roi, selected_year, selected_month)
-                elif analysis_type == "Active Wildfires (FIRMS)":
-                    results = wildfire.run(target_city, roi, selected_year, selected_month)
-                elif analysis_type == "Land Cover Classification":
-                    results = land_cover.run(target_city, roi, selected_year, selected_month)
-                
+                # The trend query is independent of the selected module, so its
+                # Earth Engine round-trips run in a worker thread meanwhile
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    ts_future = None
+                    if enable_ts:
+                        ts_future = executor.submit(
+                            time_series.fetch_monthly_values, ts_target, roi, selected_year
+                        )
+
+                    # Routing to specific module
+                    if analysis_type == "Precipitation & Rainfall (NASA GPM)":
+                        results = rainfall.run(target_city, roi, selected_year, selected_month)
+                    elif analysis_type == "Terrain Analysis (DEM / Slope / Aspect)":
+                        results = dem_analysis.run(target_city, roi, selected_year, selected_month)
+                    elif analysis_type == "Flood Mapping & Risk (SAR)":
+                        results = flood_mapping.run(target_city, roi, selected_year, selected_month)
+                    elif analysis_type == "Spectral Indices & Environmental Metrics":
+                        results = rs_indices.run(target_city, roi, selected_year, selected_month)
+                    elif analysis_type == "Air Quality Monitoring (Sentinel-5P)":
+                        results = air_quality.run(target_city, roi, selected_year, selected_month, "NO2")
+                    elif analysis_type == "Land Surface Temperature (LST)":
+                        results = lst.run(target_city, roi, selected_year, selected_month)
+                    elif analysis_type == "Active Wildfires (FIRMS)":
+                        results = wildfire.run(target_city, roi, selected_year, selected_month)
+                    elif analysis_type == "Land Cover Classification":
+                        results = land_cover.run(target_city, roi, selected_year, selected_month)
+
+                if ts_future is not None:
+                    try:
+                        st.session_state.ts_prefetch = {ts_key: ts_future.result()}
+                    except Exception:
+                        # run_analysis retries and reports the error itself
+                        st.session_state.ts_prefetch = {}
+
                 st.session_state.stats = results
                 st.session_state.data_captured = True
                 st.success(f"Computation for {target_city} completed successfully.")
@@ -267,16 +293,9 @@ if authenticate_gee():
             st.markdown("---")
             st.subheader("📊 Temporal Trend Visualizer")
             
-            # Map UI modules to Time Series parameters
-            ts_mapping = {
-                "Precipitation & Rainfall (NASA GPM)": "Rainfall",
-                "Air Quality Monitoring (Sentinel-5P)": "Air Quality",
-                "Land Surface Temperature (LST)": "Temp",
-                "Spectral Indices & Environmental Metrics": "Vegetation"
-            }
-            ts_target = ts_mapping.get(analysis_type, "Vegetation")
-            
-            fig = time_series.run_analysis(ts_target, roi, selected_year)
+            fig = time_series.run_analysis(
+                ts_target, roi, selected_year, st.session_state.ts_prefetch.get(ts_key)
+            )
             
             if fig:
                 # Use unique key to prevent DuplicateElementId error
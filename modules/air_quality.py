@@ -1,7 +1,6 @@
 import streamlit as st
 import ee
-import geemap.foliumap as geemap
-from streamlit_folium import folium_static
+from utils.helpers import display_map, add_colorbar, new_map
 
 def run(country_name, roi, year, month, pollutant_choice):
     st.markdown(f"### 💨 Air Quality Intelligence: {pollutant_choice}")
@@ -34,7 +33,7 @@ def run(country_name, roi, year, month, pollutant_choice):
             .filterDate(start_date, end_date) \
             .select(band_name)
 
-        if collection.size().getInfo() == 0:
+        if collection.limit(1).size().getInfo() == 0:
             st.warning(f"No satellite data found for {key} in the selected period.")
             return {"Status": "No Data Found"}
 
@@ -67,14 +66,15 @@ def run(country_name, roi, year, month, pollutant_choice):
     }.get(key, {'min': 0, 'max': 0.0002, 'palette': ['blue', 'red']})
 
     # Map Rendering
-    m = geemap.Map()
-    m.add_basemap("HYBRID")
-    m.addLayer(image, vis_params, f"{key} Concentration")
-    m.add_colorbar(vis_params, label=f"{key} Density (mol/m²)", orientation="horizontal")
-    m.centerObject(roi, 10)
+    def build_map():
+        m = new_map("HYBRID")
+        m.addLayer(image, vis_params, f"{key} Concentration")
+        add_colorbar(m, vis_params, label=f"{key} Density (mol/m²)")
+        m.centerObject(roi, 10)
+        return m
 
     st.markdown('<div style="border: 3px solid #2980B9; border-radius: 15px; overflow: hidden;">', unsafe_allow_html=True)
-    folium_static(m, width=1000)
+    display_map(build_map, ("air_quality", country_name, year, month, key))
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.success(f"Analysis complete for {country_name}. Temporal average calculated from Sentinel-5P L3 Offline products.")
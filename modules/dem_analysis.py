@@ -1,7 +1,7 @@
 import streamlit as st
 import ee
-import geemap.foliumap as geemap
-from streamlit_folium import folium_static
+from concurrent.futures import ThreadPoolExecutor
+from utils.helpers import display_map, add_colorbar, new_map
 
 def run(country_name, roi, year, month):
     st.markdown(f"""
@@ -27,20 +27,27 @@ def run(country_name, roi, year, month):
             hillshade = ee.Terrain.hillshade(dem)
 
             # --- QUANTITATIVE ANALYSIS ---
-            # Calculate Elevation and Slope Statistics
-            elev_stats = dem.reduceRegion(
+            # Calculate Elevation and Slope Statistics.
+            # The two requests are independent, so they run concurrently.
+            elev_query = dem.reduceRegion(
                 reducer=ee.Reducer.mean().combine(ee.Reducer.minMax(), sharedInputs=True),
                 geometry=roi,
                 scale=30,
                 maxPixels=1e9
-            ).getInfo()
+            )
 
-            slope_stats = slope.reduceRegion(
+            slope_query = slope.reduceRegion(
                 reducer=ee.Reducer.mean().combine(ee.Reducer.max(), sharedInputs=True),
                 geometry=roi,
                 scale=30,
                 maxPixels=1e9
-            ).getInfo()
+            )
+
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                elev_future = executor.submit(elev_query.getInfo)
+                slope_future = executor.submit(slope_query.getInfo)
+                elev_stats = elev_future.result()
+                slope_stats = slope_future.result()
 
             # Formatting results
             mean_elev = f"{elev_stats.get('DSM_mean', 0):.1f} m"
@@ -61,15 +68,17 @@ def run(country_name, roi, year, month):
     vis_aspect = {'min': 0, 'max': 360, 'palette': ['#e74c3c', '#f1c40f', '#2ecc71', '#3498db', '#e74c3c']}
 
     def render_map(image, vis, label, unit):
-        m = geemap.Map()
-        m.add_basemap("HYBRID")
-        m.addLayer(hillshade, {'min': 150, 'max': 255, 'opacity': 0.6}, "Hillshade Relief", True)
-        m.addLayer(image, vis, label)
-        m.add_colorbar(vis, label=f"{label} ({unit})", orientation="horizontal")
-        m.centerObject(roi, 11)
+        def build_map():
+            m = new_map("HYBRID")
+            m.addLayer(hillshade, {'min': 150, 'max': 255, 'opacity': 0.6}, "Hillshade Relief", True)
+            m.addLayer(image, vis, label)
+            add_colorbar(m, vis, label=f"{label} ({unit})")
+            m.centerObject(roi, 11)
+            return m
         
         st.markdown('<div style="border: 3px solid #117A65; border-radius: 15px; overflow: hidden;">', unsafe_allow_html=True)
-        folium_static(m, width=1000)
+        # Terrain layers are static, so the map only depends on the area
+        display_map(build_map, ("dem_analysis", country_name, label))
         st.markdown('</div>', unsafe_allow_html=True)
 
     with tab1:
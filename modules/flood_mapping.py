@@ -1,7 +1,204 @@
 import streamlit as st
 import ee
-import geemap.foliumap as geemap
-from streamlit_folium import folium_static
+import functools
+from utils.helpers import display_map, download_button, new_map
+from utils.geometry_utils import get_roi_center
+
+# Area reductions are pinned to a single equal-area grid, so every counted
+# pixel covers exactly _GRID_SCALE² square meters. The composite itself is
+# left unprojected, so map tiles are computed at each zoom level's scale.
+_GRID_CRS = 'EPSG:6933'
+_GRID_SCALE = 30
+# Coarser grid used when the 30 m analysis exceeds Earth Engine's memory limit
+_FALLBACK_SCALE = 90
+
+# Otsu thresholds are clamped to the typical VV open-water range so that
+# scenes without a water mode do not yield a land/land split.
+_THRESHOLD_MIN_DB = -24
+_THRESHOLD_MAX_DB = -15
+
+@functools.lru_cache(maxsize=None)
+def _srtm():
+    # Static global asset, built once on first use (after ee.Initialize)
+    return ee.Image("USGS/SRTMGL1_003")
+
+def _lee_filter(image_db, radius=3, enl=5):
+    """
+    Lee speckle filter for a single-band SAR backscatter image in dB.
+    Filtering is done in linear power over a square window of
+    (2*radius+1)² analysis-grid pixels, and the result is converted back to
+    dB. The window is set in meters, so map tiles at any zoom filter the
+    same ground extent as the 30 m area reductions. Unlike a median filter, it
+    smooths homogeneous areas while preserving water/land edges.
+    Args:
+        image_db (ee.Image): Backscatter in decibels.
+        radius (int): Window radius in _GRID_SCALE pixels (3 -> 7x7, 210 m).
+        enl (float): Equivalent number of looks of the input.
+    Returns:
+        ee.Image: Filtered backscatter in decibels.
+    """
+    linear = ee.Image(10).pow(image_db.divide(10))
+    local = linear.reduceNeighborhood(
+        reducer=ee.Reducer.mean().combine(ee.Reducer.variance(), sharedInputs=True),
+        kernel=ee.Kernel.square(radius * _GRID_SCALE, 'meters')
+    )
+    local_mean = local.select(0)
+    local_var = local.select(1)
+
+    # Signal variance after removing the multiplicative speckle term
+    cu2 = 1.0 / enl
+    signal_var = local_var.subtract(local_mean.pow(2).multiply(cu2)).divide(1 + cu2).max(0)
+    weight = signal_var.divide(local_var).unmask(0)
+
+    filtered = local_mean.add(weight.multiply(linear.subtract(local_mean)))
+    return filtered.log10().multiply(10).rename(image_db.bandNames())
+
+def _otsu(histogram):
+    """
+    Otsu threshold computed server-side from an ee.Reducer.histogram()
+    output, by maximizing the between-class variance over bucket splits.
+    Args:
+        histogram (ee.Dictionary): Histogram with 'histogram' and 'bucketMeans'.
+    Returns:
+        ee.Number: Bucket mean that best separates the two classes.
+    """
+    histogram = ee.Dictionary(histogram)
+    counts = ee.Array(histogram.get('histogram'))
+    means = ee.Array(histogram.get('bucketMeans'))
+    size = means.length().get([0])
+    total = counts.reduce(ee.Reducer.sum(), [0]).get([0])
+    total_sum = means.multiply(counts).reduce(ee.Reducer.sum(), [0]).get([0])
+    mean = total_sum.divide(total)
+
+    # Split after bucket i-1; the last bucket is excluded so class B is never empty
+    splits = ee.List.sequence(1, size.subtract(1))
+
+    def between_class_variance(i):
+        a_counts = counts.slice(0, 0, i)
+        a_count = a_counts.reduce(ee.Reducer.sum(), [0]).get([0])
+        a_mean = means.slice(0, 0, i).multiply(a_counts) \
+            .reduce(ee.Reducer.sum(), [0]).get([0]).divide(a_count)
+        b_count = total.subtract(a_count)
+        b_mean = total_sum.subtract(a_count.multiply(a_mean)).divide(b_count)
+        return a_count.multiply(a_mean.subtract(mean).pow(2)) \
+            .add(b_count.multiply(b_mean.subtract(mean).pow(2)))
+
+    bcv = ee.Array(splits.map(between_class_variance))
+    return means.slice(0, 0, size.subtract(1)).sort(bcv).get([-1])
+
+def _analyse_radar(s1_col, roi, scale):
+    """
+    Builds the speckle-filtered composite on the equal-area grid and
+    resolves scene count, Otsu threshold and water pixel count in a
+    single getInfo round-trip.
+    Args:
+        s1_col (ee.ImageCollection): Sentinel-1 VV scenes for the period.
+        roi (ee.FeatureCollection): Region of interest.
+        scale (int): Grid resolution in meters.
+    Returns:
+        tuple: (smoothed ee.Image in dB, payload dict).
+    """
+    # Speckle reduction and median composite; the reductions below set
+    # crs/scale themselves, so display and export tiles stay zoom-dependent
+    after_img = s1_col.median().clip(roi)
+    smoothed = _lee_filter(after_img)
+
+    # Flood water classification (Otsu thresholding on the backscatter histogram)
+    histogram = smoothed.reduceRegion(
+        reducer=ee.Reducer.histogram(maxBuckets=256),
+        geometry=roi,
+        crs=_GRID_CRS,
+        scale=scale,
+        maxPixels=1e9,
+        tileScale=4
+    ).get('VV')
+    threshold = ee.Number(_otsu(histogram)).max(_THRESHOLD_MIN_DB).min(_THRESHOLD_MAX_DB)
+    water = smoothed.lt(threshold)
+
+    # Scene availability, threshold and flooded area in a single round-trip.
+    # The reductions are only evaluated when radar scenes exist.
+    scene_count = s1_col.limit(1).size()
+    payload = ee.Dictionary({
+        'count': scene_count,
+        'result': ee.Algorithms.If(
+            scene_count.gt(0),
+            ee.Dictionary({
+                'threshold': threshold,
+                # Water pixel count and their mean backscatter in one pass
+                'stats': smoothed.updateMask(water).reduceRegion(
+                    reducer=ee.Reducer.count().combine(ee.Reducer.mean(), sharedInputs=True),
+                    geometry=roi,
+                    crs=_GRID_CRS,
+                    scale=scale,
+                    maxPixels=1e9,
+                    tileScale=4
+                )
+            }),
+            ee.Dictionary()
+        )
+    }).getInfo()
+    return smoothed, payload
+
+def _compute_flood(roi, year, month):
+    """
+    Runs the Earth Engine side of the flood analysis for one month.
+    Args:
+        roi (ee.FeatureCollection): Region of interest.
+        year (int): Year of the analysis.
+        month (int): Month of the analysis.
+    Returns:
+        dict: Water layer, topographic risk layer, flooded area (km²),
+        Otsu threshold (dB), mean water backscatter (dB) and grid scale (m),
+        or None if no Sentinel-1 scenes cover the period.
+    """
+    # 1. Date configuration
+    start_date = ee.Date.fromYMD(year, month, 1)
+    end_date = start_date.advance(1, 'month')
+
+    # 2. Radar processing (Sentinel-1 SAR)
+    s1_col = (
+        ee.ImageCollection('COPERNICUS/S1_GRD')
+        .filterBounds(roi)
+        .filterDate(start_date, end_date)
+        .filter(ee.Filter.eq('instrumentMode', 'IW'))
+        .select('VV')
+    )
+
+    try:
+        scale = _GRID_SCALE
+        smoothed, payload = _analyse_radar(s1_col, roi, scale)
+    except ee.EEException:
+        # Retry the whole chain on a coarser grid instead of failing
+        scale = _FALLBACK_SCALE
+        smoothed, payload = _analyse_radar(s1_col, roi, scale)
+
+    if payload['count'] == 0:
+        return None
+
+    # Displayed layers use the resolved threshold as a constant, so map
+    # tiles do not recompute the ROI-wide histogram
+    threshold_db = payload['result']['threshold']
+    flood_mask = smoothed.lt(threshold_db).rename('flood')
+    actual_flood = flood_mask.updateMask(flood_mask)
+
+    # 3. Topographic modeling (SRTM)
+    elevation = _srtm().clip(roi)
+    slope = ee.Terrain.slope(elevation)
+    risk_zones = slope.lt(1.5).bitwiseAnd(elevation.lt(1200))
+    prone_areas = risk_zones.updateMask(risk_zones)
+
+    # 4. Area calculation
+    stats = payload['result']['stats']
+    flooded_km2 = (stats.get('VV_count', 0) or 0) * scale ** 2 / 1e6
+
+    return {
+        "actual_flood": actual_flood,
+        "prone_areas": prone_areas,
+        "flooded_km2": flooded_km2,
+        "threshold_db": threshold_db,
+        "water_db": stats.get('VV_mean'),
+        "scale": scale
+    }
 
 def run(country_name, roi, year, month):
     # --- Professional Header ---
@@ -15,65 +212,40 @@ def run(country_name, roi, year, month):
     """, unsafe_allow_html=True)
     st.write("")
 
-    # 1. Date configuration
-    start_date = ee.Date.fromYMD(year, month, 1)
-    end_date = start_date.advance(1, 'month')
-    
-    # 2. Radar processing (Sentinel-1 SAR)
     with st.spinner("🛰️ Analyzing Radar Backscatter Coefficients..."):
-        s1_col = (
-            ee.ImageCollection('COPERNICUS/S1_GRD')
-            .filterBounds(roi)
-            .filterDate(start_date, end_date)
-            .filter(ee.Filter.eq('instrumentMode', 'IW'))
-            .select('VV')
-        )
-
-        if s1_col.size().getInfo() == 0:
-            st.warning(f"⚠️ No radar data found for {month}/{year}.")
-            return {"Status": "No Satellite Coverage"}
+        flood = _compute_flood(roi, year, month)
 
-        # Speckle reduction and median composite
-        after_img = s1_col.median().clip(roi)
-        smoothed = after_img.focal_median(50, 'circle', 'meters') 
+    if flood is None:
+        st.warning(f"⚠️ No radar data found for {month}/{year}.")
+        return {"Status": "No Satellite Coverage"}
 
-        # Flood water classification (Thresholding technique)
-        flood_mask = smoothed.lt(-17).rename('flood')
-        actual_flood = flood_mask.updateMask(flood_mask)
-
-    # 3. Topographic modeling (SRTM)
-    elevation = ee.Image("USGS/SRTMGL1_003").clip(roi)
-    slope = ee.Terrain.slope(elevation)
-    risk_zones = slope.lt(1.5).bitwiseAnd(elevation.lt(1200))
-    prone_areas = risk_zones.updateMask(risk_zones)
+    actual_flood = flood['actual_flood']
+    prone_areas = flood['prone_areas']
+    flooded_km2 = flood['flooded_km2']
+    threshold_db = flood['threshold_db']
+    water_db = flood['water_db']
+    scale = flood['scale']
 
-    # 4. Map visualization
-    m = geemap.Map()
-    m.add_basemap("HYBRID")
-    m.addLayer(prone_areas, {'palette': '#FF4B4B', 'opacity': 0.4}, "High-Risk Topography")
-    m.addLayer(actual_flood, {'palette': '#00D4FF'}, "Satellite Detected Water")
-    m.add_legend(title="Risk Legend", legend_dict={
-        "Flood Prone (Topography)": "#FF4B4B",
-        "Detected Flood (SAR)": "#00D4FF"
-    })
-    m.centerObject(roi, 11)
+    # 1. Map visualization
+    def build_map():
+        m = new_map("HYBRID")
+        m.addLayer(prone_areas, {'palette': '#FF4B4B', 'opacity': 0.4}, "High-Risk Topography")
+        m.addLayer(actual_flood, {'palette': '#00D4FF'}, "Satellite Detected Water")
+        m.add_legend(title="Risk Legend", legend_dict={
+            "Flood Prone (Topography)": "#FF4B4B",
+            "Detected Flood (SAR)": "#00D4FF"
+        })
+        m.set_center(*get_roi_center(country_name), 11)
+        return m
 
     st.markdown('<div style="border: 3px solid #1F618D; border-radius: 15px; overflow: hidden;">', unsafe_allow_html=True)
-    folium_static(m, width=1000)
+    display_map(build_map, ("flood_mapping", country_name, year, month))
     st.markdown('</div>', unsafe_allow_html=True)
 
-    # 5. Summary Metrics
+    # 2. Summary Metrics
     st.markdown("### 📊 Quantitative Metrics")
 
-    # Area calculation
-    stats = actual_flood.multiply(ee.Image.pixelArea()).reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=roi,
-        scale=30,
-        maxPixels=1e9
-    ).getInfo()
-
-    flooded_km2 = (stats.get('flood', 0) or 0) / 1e6
+    # Risk classification
     risk_level = "Critical" if flooded_km2 > 5 else "Alert" if flooded_km2 > 1 else "Stable"
 
     c1, c2, c3 = st.columns(3)
@@ -82,15 +254,31 @@ def run(country_name, roi, year, month):
     with c2:
         st.metric("Risk Status", risk_level)
     with c3:
-        st.metric("Sensor", "Sentinel-1 SAR")
+        st.metric("Water Threshold (Otsu)", f"{threshold_db:.1f} dB")
+
+    if water_db is not None:
+        st.caption(f"Mean backscatter of detected water: {water_db:.1f} dB")
 
     st.success(f"Analysis complete. Radar signals used to detect surface water regardless of cloud cover.")
 
+    # 3. On-demand GeoTIFF export of the detected water mask
+    download_button(
+        actual_flood,
+        country_name,
+        ("flood_mapping", country_name, year, month),
+        file_name=f"Flood_{country_name}_{year}_{month:02d}",
+        scale=scale,
+        # 0/1 water mask
+        bytes_per_pixel=1
+    )
+
     # --- RETURN DATA FOR PDF REPORT ---
     return {
         "Submerged Area": f"{flooded_km2:.2f} sq km",
         "Hazard Level": risk_level,
-        "Detection Method": "SAR Backscatter Thresholding",
+        "Detection Method": "SAR Backscatter Thresholding (Otsu)",
+        "Water Threshold": f"{threshold_db:.1f} dB",
+        "Water Backscatter": f"{water_db:.1f} dB" if water_db is not None else "N/A",
         "Satellite Platform": "Sentinel-1 (VV)",
         "Topographic Risk": "Integrated SRTM Elevation"
     }
@@ -1,8 +1,46 @@
 import streamlit as st
 import ee
-import geemap.foliumap as geemap
-from streamlit_folium import folium_static
+import functools
+from utils.helpers import display_map, new_map
+from utils.geometry_utils import get_roi_center
 import pandas as pd
+import altair as alt
+
+# ESA WorldCover classes reported by the classifier
+_CLASS_VALUES = [10, 20, 30, 40, 50, 60, 80]
+_CLASS_NAMES = ['Trees', 'Shrubland', 'Grassland', 'Cropland', 'Built-up', 'Bare Ground', 'Water']
+_CLASS_COLORS = ['#006400', '#ffbb22', '#ffff4c', '#f096ff', '#fa0000', '#b4b4b4', '#0064ff']
+_CLASS_LOOKUP = dict(zip(_CLASS_VALUES, _CLASS_NAMES))
+
+@functools.lru_cache(maxsize=None)
+def _esa_worldcover():
+    # Static global asset, built once on first use (after ee.Initialize)
+    return ee.Image("ESA/WorldCover/v200/2021")
+
+@st.cache_data(show_spinner=False)
+def _lc_chart(stats_items):
+    # Vega-Lite spec of the per-class area chart, built once per result set
+    df = pd.DataFrame(stats_items, columns=['Category', 'Area_km2'])
+    chart = alt.Chart(df).mark_bar().encode(
+        x=alt.X('Category:N', sort=None),
+        y=alt.Y('Area_km2:Q', title='Area (km²)')
+    )
+    return chart.to_dict()
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def _class_area_stats(country_name, year, month, _classified, _roi, scale=100):
+    # Earth Engine evaluates lazily: Random Forest training and
+    # classification run on this request, so caching its result per
+    # (area, year, month) keeps them off identical reruns.
+    area_calc = ee.Image.pixelArea().addBands(_classified)
+    return area_calc.reduceRegion(
+        # Area and pixel count per class from one shared pass over the pixels
+        reducer=ee.Reducer.sum().combine(ee.Reducer.count(), sharedInputs=True)
+            .group(groupField=1, groupName='class'),
+        geometry=_roi, scale=scale, maxPixels=1e10, bestEffort=True,
+        # Grouped reducers hold per-class state, so split into more tiles
+        tileScale=8
+    ).get('groups').getInfo()
 
 def run(country_name, roi, year, month):
     st.markdown(f"""
@@ -35,19 +73,33 @@ def run(country_name, roi, year, month):
         .select(['B2', 'B3', 'B4', 'B8', 'B11', 'B12'])
     )
 
-    if s2_collection.size().getInfo() == 0:
+    if s2_collection.limit(1).size().getInfo() == 0:
         st.warning("No imagery found for this period. Expanding search...")
         s2_collection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED').filterBounds(roi).map(mask_s2_clouds).select(['B2', 'B3', 'B4', 'B8', 'B11', 'B12'])
 
     image = s2_collection.median().clip(roi)
 
     # 3. Training Logic (Random Forest)
-    label_source = ee.Image("ESA/WorldCover/v200/2021").clip(roi)
+    label_source = _esa_worldcover().clip(roi)
     
     with st.spinner("Training Random Forest Classifier (100 Trees)..."):
         try:
-            training_points = label_source.sample(region=roi, scale=100, numPixels=1500, seed=42, geometries=True)
-            training_data = image.sampleRegions(collection=training_points, properties=['Map'], scale=10)
+            # Labels and spectral features are drawn in one stratified pass,
+            # with an equal quota per class so minority classes are represented.
+            # Stratification scans the whole governorate, so it runs on the
+            # same 100 m grid as the old label draw and the area statistics,
+            # split into more tiles for the large governorates.
+            training_data = image.addBands(label_source).stratifiedSample(
+                numPoints=0,
+                classBand='Map',
+                region=roi,
+                scale=100,
+                classValues=_CLASS_VALUES,
+                classPoints=[200] * len(_CLASS_VALUES),
+                seed=42,
+                geometries=False,
+                tileScale=8
+            )
             classifier = ee.Classifier.smileRandomForest(100).train(
                 features=training_data,
                 classProperty='Map',
@@ -58,43 +110,46 @@ def run(country_name, roi, year, month):
             st.error(f"ML Training Error: {e}")
             return {"Status": "Training Failed"}
 
-    # 4. Definitions
-    class_values = [10, 20, 30, 40, 50, 60, 80]
-    class_names = ['Trees', 'Shrubland', 'Grassland', 'Cropland', 'Built-up', 'Bare Ground', 'Water']
-    class_colors = ['#006400', '#ffbb22', '#ffff4c', '#f096ff', '#fa0000', '#b4b4b4', '#0064ff']
-
-    # 5. Statistics Calculation
+    # 4. Statistics Calculation
     stats_dict = {}
+    pixel_counts = {}
     st.markdown("### 📊 Classification Statistics")
     try:
-        area_calc = ee.Image.pixelArea().addBands(classified)
-        area_stats = area_calc.reduceRegion(
-            reducer=ee.Reducer.sum().group(groupField=1, groupName='class'),
-            geometry=roi, scale=100, maxPixels=1e10
-        ).get('groups').getInfo()
+        try:
+            area_stats = _class_area_stats(country_name, year, month, classified, roi)
+        except ee.EEException:
+            # Pixel-area sums stay valid at a coarser scale
+            area_stats = _class_area_stats(country_name, year, month, classified, roi, scale=300)
 
         for item in area_stats:
-            c_id = int(item['class'])
-            if c_id in class_values:
-                name = class_names[class_values.index(c_id)]
-                area_km2 = item['sum'] / 1e6
-                stats_dict[name] = f"{area_km2:.2f} km²"
+            name = _CLASS_LOOKUP.get(int(item['class']))
+            if name:
+                stats_dict[name] = f"{item['sum'] / 1e6:.2f} km²"
+                pixel_counts[name] = int(item['count'])
         
-        st.bar_chart(pd.DataFrame([{'Category': k, 'Area (km²)': float(v.split()[0])} for k,v in stats_dict.items()]).set_index('Category'))
-    except:
-        st.info("Computing spatial statistics...")
-
-    # 6. Map Rendering
-    m = geemap.Map()
-    m.add_basemap("SATELLITE")
-    vis_image = classified.remap(class_values, list(range(len(class_values))))
-    m.addLayer(image, {'bands': ['B4', 'B3', 'B2'], 'min': 0, 'max': 0.3}, "Reference Imagery")
-    m.addLayer(vis_image, {'min': 0, 'max': 6, 'palette': class_colors}, "RF Classification")
-    m.add_legend(title="Land Cover Type", legend_dict=dict(zip(class_names, class_colors)))
-    m.centerObject(roi, 10)
+        chart_items = tuple((k, float(v.split()[0])) for k, v in stats_dict.items())
+        st.vega_lite_chart(_lc_chart(chart_items), use_container_width=True)
+
+        with st.expander("📂 View Class Statistics Table"):
+            st.table(pd.DataFrame({
+                'Area': pd.Series(stats_dict),
+                'Pixels': pd.Series(pixel_counts)
+            }))
+    except ee.EEException as e:
+        st.warning(f"Spatial statistics unavailable: {e}")
+
+    # 5. Map Rendering
+    def build_map():
+        m = new_map("SATELLITE")
+        vis_image = classified.remap(_CLASS_VALUES, list(range(len(_CLASS_VALUES))))
+        m.addLayer(image, {'bands': ['B4', 'B3', 'B2'], 'min': 0, 'max': 0.3}, "Reference Imagery")
+        m.addLayer(vis_image, {'min': 0, 'max': 6, 'palette': _CLASS_COLORS}, "RF Classification")
+        m.add_legend(title="Land Cover Type", legend_dict=dict(zip(_CLASS_NAMES, _CLASS_COLORS)))
+        m.set_center(*get_roi_center(country_name), 10)
+        return m
     
     st.markdown('<div style="border: 3px solid #7D3C98; border-radius: 15px; overflow: hidden;">', unsafe_allow_html=True)
-    folium_static(m, width=1000)
+    display_map(build_map, ("land_cover", country_name, year, month))
     st.markdown('</div>', unsafe_allow_html=True)
 
     # Return for PDF
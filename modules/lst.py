@@ -1,7 +1,6 @@
 import streamlit as st
 import ee
-import geemap.foliumap as geemap
-from streamlit_folium import folium_static
+from utils.helpers import display_map, add_colorbar, new_map
 
 def run(country_name, roi, year, month):
     st.markdown(f"""
@@ -26,16 +25,19 @@ def run(country_name, roi, year, month):
             .select('LST_Day_1km')
         )
 
-        if dataset.size().getInfo() == 0:
+        if dataset.limit(1).size().getInfo() == 0:
             st.warning("No thermal data found for the selected period.")
             return {"Status": "No Data Found"}
 
         # 3. Radiometric Calibration (Kelvin to Celsius)
         # Formula: (DN * 0.02) - 273.15
+        # The calibration is affine, so it is applied once to the mean
+        # rather than mapped over every daily image.
         lst_celsius = (
             dataset
-            .map(lambda img: img.multiply(0.02).subtract(273.15))
             .mean()
+            .multiply(0.02)
+            .subtract(273.15)
             .clip(roi)
         )
 
@@ -46,7 +48,9 @@ def run(country_name, roi, year, month):
             ),
             geometry=roi,
             scale=1000,
-            maxPixels=1e9
+            maxPixels=1e9,
+            bestEffort=True,
+            tileScale=4
         ).getInfo()
 
         mean_temp = stats.get('LST_Day_1km_mean')
@@ -70,14 +74,15 @@ def run(country_name, roi, year, month):
         st.metric("Sensor Source", "MOD11A1.061")
 
     # 7. Map Rendering
-    m = geemap.Map()
-    m.add_basemap("HYBRID")
-    m.addLayer(lst_celsius, vis_params, "Surface Temperature (°C)")
-    m.add_colorbar(vis_params, label="LST (Celsius)", orientation="horizontal")
-    m.centerObject(roi, 7)
+    def build_map():
+        m = new_map("HYBRID")
+        m.addLayer(lst_celsius, vis_params, "Surface Temperature (°C)")
+        add_colorbar(m, vis_params, label="LST (Celsius)")
+        m.centerObject(roi, 7)
+        return m
 
     st.markdown('<div style="border: 3px solid #CB4335; border-radius: 15px; overflow: hidden;">', unsafe_allow_html=True)
-    folium_static(m, width=1000)
+    display_map(build_map, ("lst", country_name, year, month))
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.success(f"Thermal analysis for {country_name} finalized using MODIS Terra Daily Day-time LST.")
@@ -1,7 +1,36 @@
 import streamlit as st
 import ee
-import geemap.foliumap as geemap
-from streamlit_folium import folium_static
+from utils.helpers import display_map, add_image_overlay, new_map
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def _rainfall_stats(country_name, year, month, _image, _roi):
+    # Mean and peak precipitation per (area, year, month); identical
+    # reruns are served from the cache without contacting Earth Engine.
+    # ERA5-Land cells shrink with latitude, so the mean is weighted by
+    # pixel area: sum(rain * area) / sum(area). The area band carries the
+    # land-only rain mask, so both sums cover the same cells.
+    rain = _image.rename('rain')
+    area = ee.Image.pixelArea().updateMask(rain.mask())
+    stats = rain.multiply(area).rename('rain_area') \
+        .addBands(area.rename('area')) \
+        .addBands(rain) \
+        .reduceRegion(
+            reducer=ee.Reducer.sum().combine(
+                reducer2=ee.Reducer.max(),
+                sharedInputs=True
+            ),
+            geometry=_roi,
+            scale=11132,
+            maxPixels=1e9,
+            bestEffort=True,
+            tileScale=4
+        ).getInfo()
+
+    area_sum = stats.get('area_sum') or 0
+    return {
+        'mean': (stats.get('rain_area_sum') or 0) / area_sum if area_sum else None,
+        'max': stats.get('rain_max')
+    }
 
 def run(country_name, roi, year, month):
     st.markdown(f"### 🌧️ Precipitation Analysis (ECMWF ERA5-Land)")
@@ -11,28 +40,26 @@ def run(country_name, roi, year, month):
     
     try:
 
-        rainfall_img = ee.ImageCollection("ECMWF/ERA5_LAND/MONTHLY_AGGR") \
+        era5_img = ee.ImageCollection("ECMWF/ERA5_LAND/MONTHLY_AGGR") \
             .filterDate(date_string) \
-            .select('total_precipitation_sum') \
-            .first() \
-            .clip(roi)
+            .first()
+
+        # Current band name with a server-side fallback to the legacy one
+        band = ee.Algorithms.If(
+            era5_img.bandNames().contains('total_precipitation_sum'),
+            'total_precipitation_sum',
+            'total_precipitation'
+        )
+        rainfall_img = era5_img.select([band]).rename('total_precipitation_sum').clip(roi)
 
         
         total_rainfall_mm = rainfall_img.multiply(1000)
 
         
-        stats = total_rainfall_mm.reduceRegion(
-            reducer=ee.Reducer.mean().combine(
-                reducer2=ee.Reducer.max(),
-                sharedInputs=True
-            ),
-            geometry=roi,
-            scale=11132,
-            maxPixels=1e9
-        ).getInfo()
+        stats = _rainfall_stats(country_name, year, month, total_rainfall_mm, roi)
 
-        mean_val = stats.get('total_precipitation_sum_mean') or 0
-        max_val = stats.get('total_precipitation_sum_max') or 0
+        mean_val = stats.get('mean') or 0
+        max_val = stats.get('max') or 0
 
         
         col1, col2 = st.columns(2)
@@ -40,18 +67,22 @@ def run(country_name, roi, year, month):
         col2.metric("Peak Rainfall", f"{max_val:.2f} mm")
 
     
-        m = geemap.Map()
-        m.add_basemap("TERRAIN")
-        
         rain_vis = {
             'min': 0,
             'max': 100, 
             'palette': ['#f7fbff', '#6baed6', '#084594'] # تدرج أزرق احترافي
         }
-        
-        m.addLayer(total_rainfall_mm, rain_vis, "Precipitation (mm)")
-        m.centerObject(roi, 8)
-        folium_static(m, width=1000)
+
+        def build_map():
+            m = new_map("TERRAIN")
+            # ERA5-Land is ~11 km, so a single PNG holds the full detail
+            add_image_overlay(m, total_rainfall_mm, country_name,
+                              ("rainfall", country_name, year, month),
+                              rain_vis, "Precipitation (mm)")
+            m.centerObject(roi, 8)
+            return m
+
+        display_map(build_map, ("rainfall", country_name, year, month))
 
         return {
             "Module": "Rainfall (ERA5)",
@@ -1,9 +1,34 @@
 import streamlit as st
 import ee
-import geemap.foliumap as geemap
-from streamlit_folium import folium_static
+from utils.helpers import display_map, download_button, add_colorbar, new_map
 import pandas as pd
 
+@st.cache_data(show_spinner=False, ttl=3600)
+def _index_stats(country_name, year, month, index_choice, hist_min, hist_max, _result, _roi, _expanded, _crs):
+    # Numerical results only: switching back to an index already computed
+    # for this (area, year, month) skips the 30 m reduction entirely.
+    # Summary statistics and the value distribution share one pixel scan;
+    # the search-window flag rides along in the same request.
+    # fixedHistogram drops values outside [min, max), so the histogram reads
+    # a second band clamped into the display range: the tails are counted
+    # in the edge buckets while mean/min/max see the raw index.
+    half_step = (hist_max - hist_min) / 80
+    hist_band = _result.clamp(hist_min, hist_max - half_step).rename('Index_clamped')
+    stats = _result.addBands(hist_band).reduceRegion(
+        # Two inputs: band 1 -> mean/minMax, band 2 -> histogram. Bucket
+        # edges fixed to the display range: single streaming pass and the
+        # same x-axis on every render
+        reducer=ee.Reducer.mean()
+            .combine(ee.Reducer.minMax(), sharedInputs=True)
+            .combine(ee.Reducer.fixedHistogram(hist_min, hist_max, 40), sharedInputs=False),
+        geometry=_roi,
+        # Native Landsat UTM grid: no per-tile reprojection of the composite
+        crs=_crs,
+        scale=30,
+        maxPixels=1e9
+    )
+    return ee.Dictionary(stats).set('expanded', _expanded).getInfo()
+
 def run(country_name, roi, year, month):
     st.markdown(f"""
         <div style="background-color: #1D8348; padding: 20px; border-radius: 15px; text-align: center; border: 2px solid #145A32;">
@@ -30,25 +55,30 @@ def run(country_name, roi, year, month):
 
     def mask_landsat_clouds(image):
         qa = image.select('QA_PIXEL')
-        mask = qa.bitwiseAnd(1 << 3).eq(0).bitwiseAnd(1 << 4).eq(0)
+        # Dilated cloud, cirrus, cloud and cloud shadow tested in one bitmask
+        mask_bits = (1 << 1) | (1 << 2) | (1 << 3) | (1 << 4)
+        mask = qa.bitwiseAnd(mask_bits).eq(0)
         return image.updateMask(mask)
 
-    with st.spinner("🛰️ Harmonizing Landsat Surface Reflectance Data..."):
-        collection = ee.ImageCollection("LANDSAT/LC08/C02/T1_L2") \
+    def _build_coll(window_start, window_end):
+        return ee.ImageCollection("LANDSAT/LC08/C02/T1_L2") \
             .filterBounds(roi) \
-            .filterDate(start_date, end_date) \
+            .filterDate(window_start, window_end) \
             .map(mask_landsat_clouds) \
             .map(apply_scale_factors)
 
-        if collection.size().getInfo() == 0:
-            st.info("Expanding search window to capture cloud-free pixels...")
-            collection = ee.ImageCollection("LANDSAT/LC08/C02/T1_L2") \
-                .filterBounds(roi) \
-                .filterDate(start_date.advance(-6, 'month'), end_date) \
-                .map(mask_landsat_clouds) \
-                .map(apply_scale_factors)
+    with st.spinner("🛰️ Harmonizing Landsat Surface Reflectance Data..."):
+        # The month is a date filter on the six-month collection, so the
+        # masking and scaling steps appear once in the request graph
+        wide = _build_coll(start_date.advance(-6, 'month'), end_date)
+        narrow = wide.filterDate(start_date, end_date)
 
-        image = collection.median().clip(roi)
+        # Expand the search window server-side when the month has no scenes,
+        # instead of probing the collection size with a separate request
+        expanded = narrow.limit(1).size().eq(0)
+        image = ee.Image(ee.Algorithms.If(expanded, wide.median(), narrow.median())).clip(roi)
+        # Composites lose the source grid, so take it from a contributing scene
+        native_proj = ee.Image(wide.first()).select('SR_B4').projection()
 
     # 3. Spectral Calculations
     # Green = High, Red = Low
@@ -68,26 +98,27 @@ def run(country_name, roi, year, month):
         vis_params = {'min': -0.6, 'max': 0.2, 'palette': ['white', 'blue']}
 
     # --- SCIENTIFIC STATS ---
-    stats = result.reduceRegion(
-        reducer=ee.Reducer.mean().combine(ee.Reducer.minMax(), sharedInputs=True),
-        geometry=roi,
-        scale=30,
-        maxPixels=1e9
-    ).getInfo()
+    stats = _index_stats(country_name, year, month, index_choice,
+                         vis_params['min'], vis_params['max'], result, roi, expanded, native_proj)
+    if stats.get('expanded'):
+        st.info("Expanding search window to capture cloud-free pixels...")
 
-    mean_val = stats.get('Index_mean', 0)
-    max_val = stats.get('Index_max', 0)
+    # Multi-input reducers name outputs without a band prefix
+    mean_val = stats.get('mean', 0)
+    max_val = stats.get('max', 0)
+    histogram = stats.get('histogram')
 
     # --- MAP DISPLAY ---
-    m = geemap.Map()
-    m.add_basemap("SATELLITE")
-    m.addLayer(image, {'bands': ['SR_B4', 'SR_B3', 'SR_B2'], 'min': 0, 'max': 0.3}, "Natural Color")
-    m.addLayer(result, vis_params, index_choice)
-    m.add_colorbar(vis_params, label=f"Calculated {index_choice}", orientation="horizontal")
-    m.centerObject(roi, 11)
+    def build_map():
+        m = new_map("SATELLITE")
+        m.addLayer(image, {'bands': ['SR_B4', 'SR_B3', 'SR_B2'], 'min': 0, 'max': 0.3}, "Natural Color")
+        m.addLayer(result, vis_params, index_choice)
+        add_colorbar(m, vis_params, label=f"Calculated {index_choice}")
+        m.centerObject(roi, 11)
+        return m
     
     st.markdown('<div style="border: 3px solid #1D8348; border-radius: 15px; overflow: hidden;">', unsafe_allow_html=True)
-    folium_static(m, width=1000)
+    display_map(build_map, ("rs_indices", country_name, year, month, index_choice))
     st.markdown('</div>', unsafe_allow_html=True)
 
     # Statistics UI
@@ -96,7 +127,29 @@ def run(country_name, roi, year, month):
     c1.metric("Mean Index Value", f"{mean_val:.3f}")
     c2.metric("Maximum Peak", f"{max_val:.3f}")
 
-    
+    if histogram:
+        # fixedHistogram rows are [bucket lower edge, pixel count]
+        half_step = (vis_params['max'] - vis_params['min']) / 80
+        st.bar_chart(pd.DataFrame(
+            {'Pixels': [row[1] for row in histogram]},
+            index=pd.Index([round(row[0] + half_step, 3) for row in histogram], name=index_choice.split(" (")[0])
+        ))
+        st.caption(f"Pixel distribution over the display range {vis_params['min']} to {vis_params['max']}; "
+                   "values outside it are counted in the first and last buckets.")
+
+    # On-demand GeoTIFF export; bounds and URL are only requested on click.
+    # The index is stored as int16 (value x 10000), half the size of float32;
+    # large governorates are exported coarser than 30 m to fit the limit.
+    index_name = index_choice.split(" (")[0]
+    download_button(
+        result.multiply(10000).round().toInt16(),
+        country_name,
+        ("rs_indices", country_name, year, month, index_name),
+        file_name=f"{index_name}_{country_name}_{year}_{month:02d}",
+        scale=30,
+        bytes_per_pixel=2
+    )
+    st.caption(f"GeoTIFF values are {index_name} × 10000 (int16).")
 
     # --- RETURN FOR REPORT ---
     return {
@@ -1,107 +1,169 @@
 import streamlit as st
 import ee
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 
-def run_analysis(analysis_type, roi, year):
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+               "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+def _dataset_config(analysis_type):
+    # Dataset selection logic: (collection, label, unit, line color)
+    if "Air Quality" in analysis_type:
+        collection = ee.ImageCollection("COPERNICUS/S5P/OFFL/L3_NO2") \
+            .select('NO2_column_number_density')
+        return collection, "NO₂ Concentration", "mol/m²", '#E74C3C' # Red for Air Quality
+
+    elif "Vegetation" in analysis_type or "Indices" in analysis_type:
+        collection = ee.ImageCollection("MODIS/061/MOD13Q1") \
+            .select('NDVI')
+        return collection, "Vegetation Index (NDVI)", "NDVI Score", '#27AE60' # Green for Vegetation
+
+    elif "Temp" in analysis_type:
+        collection = ee.ImageCollection("MODIS/061/MOD11A1") \
+            .select('LST_Day_1km')
+        return collection, "Land Surface Temp", "Celsius (°C)", '#F39C12' # Orange for Temperature
+
+    elif "Rainfall" in analysis_type:
+        collection = ee.ImageCollection("NASA/GPM_L3/IMERG_V06") \
+            .select('precipitationCal')
+        return collection, "Total Precipitation", "Rainfall (mm)", '#2980B9' # Blue for Rainfall
+
+    return None
+
+def _unit_conversion(analysis_type):
+    """
+    Resolves the scale/offset that turns a monthly composite into the
+    displayed units. Chosen once per dataset, so the monthly expression
+    carries no per-month branching. The conversions are linear, so they
+    are applied to the monthly mean rather than to every input image.
+    Args:
+        analysis_type (str): One of Air Quality, Vegetation, Temp, Rainfall.
+    Returns:
+        function: (monthly mean ee.Image, month ee.ImageCollection) -> ee.Image.
+    """
+    if "Temp" in analysis_type:
+        return lambda img, m_coll: img.multiply(0.02).subtract(273.15)
+    elif "Vegetation" in analysis_type or "Indices" in analysis_type:
+        return lambda img, m_coll: img.multiply(0.0001)
+    elif "Rainfall" in analysis_type:
+        # Convert half-hourly rate (mm/hr) to monthly total:
+        # sum(rate * 0.5 h) == mean(rate) * N * 0.5 h
+        return lambda img, m_coll: img.multiply(m_coll.size().multiply(0.5))
+    return lambda img, m_coll: img
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def _monthly_values(analysis_type, roi_key, year, _roi):
+    # Cached per (dataset, region, year); roi_key stands in for the
+    # unhashable ee object
+    config = _dataset_config(analysis_type)
+    if config is None:
+        return None
+    collection = config[0]
+    to_units = _unit_conversion(analysis_type)
+    scale = 5000 if "Rainfall" in analysis_type else 1000
+
+    # Monthly Data Aggregation: the twelve monthly composites are stacked
+    # into one multi-band image and reduced in a single pass.
+    # The year is filtered once; month windows are offsets from its start.
+    year_start = ee.Date.fromYMD(year, 1, 1)
+    year_coll = collection.filterDate(year_start, year_start.advance(1, 'year'))
+
+    def monthly(month):
+        m_start = year_start.advance(ee.Number(month).subtract(1), 'month')
+        m_end = m_start.advance(1, 'month')
+        
+        # Filter collection for the specific month
+        m_coll = year_coll.filterDate(m_start, m_end)
+        # Collection-level reduce; the single band is renamed for keyed lookup
+        img = to_units(m_coll.reduce(ee.Reducer.mean()), m_coll).rename('value')
+
+        # CHECK: Months without data contribute no band instead of raising
+        # a "0 bands" error; their keys are absent and become NaN below.
+        img = ee.Image(ee.Algorithms.If(m_coll.limit(1).size().gt(0), img, ee.Image().select([])))
+        # toBands prefixes each band with the image index: "<month>_value"
+        return img.set('system:index', ee.Number(month).int().format())
+
+    stacked = ee.ImageCollection(ee.List.sequence(1, 12).map(monthly)).toBands()
+    stats = stacked.reduceRegion(
+        reducer=ee.Reducer.mean(),
+        geometry=_roi,
+        scale=scale,
+        maxPixels=1e9
+    ).getInfo()
+
+    values = np.array([stats.get(f"{month}_value") for month in range(1, 13)], dtype=np.float64)
+
+    return pd.DataFrame({"Month": np.arange(1, 13), "Month Name": MONTH_NAMES, "Value": values})
+
+def fetch_monthly_values(analysis_type, roi, year):
+    """
+    Computes the monthly mean of the selected variable over the ROI.
+    Performs Earth Engine requests only (no Streamlit calls), so it can
+    run in a worker thread alongside an analysis module.
+    Args:
+        analysis_type (str): One of Air Quality, Vegetation, Temp, Rainfall.
+        roi (ee.FeatureCollection): Region of interest.
+        year (int): Calendar year to analyse.
+    Returns:
+        pd.DataFrame: Month, Month Name and Value columns with one row per
+        month (NaN where no data), or None if the analysis type is not
+        supported.
+    """
+    # The serialized expression identifies the region for the cache key
+    return _monthly_values(analysis_type, roi.serialize(), year, roi)
+
+@st.cache_data(show_spinner=False)
+def _build_fig_spec(label, unit_label, line_color, year, month_names, values_key, _values):
+    # Keyed on the rounded values; the plotted series keeps full precision
+    # (NO2 column densities are ~1e-4). A plain dict spec is cached so each
+    # run gets its own Figure rather than a shared mutable object.
+    fig = px.line(
+        pd.DataFrame({'Month Name': month_names, 'Value': _values}),
+        x='Month Name',
+        y='Value',
+        title=f'Monthly Temporal Trend: {label} ({year})',
+        markers=True,
+        line_shape='spline',
+        color_discrete_sequence=[line_color]
+    )
+    
+    fig.update_layout(
+        xaxis_title="Calendar Month",
+        yaxis_title=unit_label,
+        hovermode="x unified",
+        template="plotly_white",
+        font=dict(family="Arial", size=12)
+    )
+    return fig.to_dict()
+
+def run_analysis(analysis_type, roi, year, monthly_data=None):
     st.markdown(f"### 📈 {analysis_type} Temporal Trend ({year})")
     
     with st.spinner("📊 Extracting temporal data from satellite constellations..."):
         try:
-            # 1. Dataset selection logic
-            if "Air Quality" in analysis_type:
-                collection = ee.ImageCollection("COPERNICUS/S5P/OFFL/L3_NO2") \
-                    .select('NO2_column_number_density')
-                label = "NO₂ Concentration"
-                unit_label = "mol/m²"
-                line_color = '#E74C3C' # Red for Air Quality
-            
-            elif "Vegetation" in analysis_type or "Indices" in analysis_type:
-                collection = ee.ImageCollection("MODIS/061/MOD13Q1") \
-                    .select('NDVI')
-                label = "Vegetation Index (NDVI)"
-                unit_label = "NDVI Score"
-                line_color = '#27AE60' # Green for Vegetation
-                
-            elif "Temp" in analysis_type:
-                collection = ee.ImageCollection("MODIS/061/MOD11A1") \
-                    .select('LST_Day_1km')
-                label = "Land Surface Temp"
-                unit_label = "Celsius (°C)"
-                line_color = '#F39C12' # Orange for Temperature
-
-            elif "Rainfall" in analysis_type:
-                collection = ee.ImageCollection("NASA/GPM_L3/IMERG_V06") \
-                    .select('precipitationCal')
-                label = "Total Precipitation"
-                unit_label = "Rainfall (mm)"
-                line_color = '#2980B9' # Blue for Rainfall
-            
-            else:
+            config = _dataset_config(analysis_type)
+            if config is None:
                 st.info("Time series analysis is optimized for Air Quality, NDVI, Temperature, and Rainfall.")
                 return None
+            _, label, unit_label, line_color = config
 
-            # 2. Monthly Data Aggregation
-            monthly_data = []
-            month_names = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", 
-                           "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-            
-            for month in range(1, 13):
-                m_start = ee.Date.fromYMD(year, month, 1)
-                m_end = m_start.advance(1, 'month')
-                
-                # Filter collection for the specific month
-                m_coll = collection.filterDate(m_start, m_end)
-                
-                # CHECK: Ensure data exists for this month to avoid "0 bands" error
-                if m_coll.size().getInfo() > 0:
-                    img = m_coll.mean()
-                    
-                    # Apply specific processing based on analysis type
-                    if "Temp" in analysis_type:
-                        img = img.multiply(0.02).subtract(273.15)
-                    elif "Vegetation" in analysis_type:
-                        img = img.multiply(0.0001)
-                    elif "Rainfall" in analysis_type:
-                        # Convert half-hourly rate (mm/hr) to monthly total 
-                        # Approx 720 hours in a month * 0.5 (half-hour steps)
-                        img = img.multiply(720 * 0.5)
-
-                    stats = img.reduceRegion(
-                        reducer=ee.Reducer.mean(),
-                        geometry=roi,
-                        scale=5000 if "Rainfall" in analysis_type else 1000,
-                        maxPixels=1e9
-                    ).getInfo()
-                    
-                    val = list(stats.values())[0] if stats else None
-                else:
-                    val = None # Data not yet available for this month
-                
-                monthly_data.append({"Month": month, "Month Name": month_names[month-1], "Value": val})
+            # Reuse values prefetched by the caller when available
+            if monthly_data is None:
+                monthly_data = fetch_monthly_values(analysis_type, roi, year)
 
-            # 3. Processing and Visualization
-            df = pd.DataFrame(monthly_data)
-            df = df.dropna() # Remove months with no satellite data
+            # Processing and Visualization
+            df = monthly_data.dropna() # Remove months with no satellite data
 
             if not df.empty:
-                fig = px.line(
-                    df,
-                    x='Month Name',
-                    y='Value',
-                    title=f'Monthly Temporal Trend: {label} ({year})',
-                    markers=True,
-                    line_shape='spline',
-                    color_discrete_sequence=[line_color]
-                )
-                
-                fig.update_layout(
-                    xaxis_title="Calendar Month",
-                    yaxis_title=unit_label,
-                    hovermode="x unified",
-                    template="plotly_white",
-                    font=dict(family="Arial", size=12)
-                )
+                # Rounded to significant figures so small-magnitude series
+                # (NO2) still produce distinct keys
+                values_key = tuple(float(f"{v:.6g}") for v in df['Value'])
+                fig = go.Figure(_build_fig_spec(
+                    label, unit_label, line_color, year,
+                    tuple(df['Month Name']), values_key, df['Value'].to_numpy()
+                ))
                 
                 st.plotly_chart(fig, use_container_width=True, key=f"ts_chart_{analysis_type}")
                 
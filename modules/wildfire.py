@@ -1,31 +1,172 @@
 import streamlit as st
 import ee
-import geemap.foliumap as geemap
-from streamlit_folium import folium_static
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.helpers import display_map, download_button, add_image_overlay, add_colorbar, new_map
+from utils.geometry_utils import get_roi_center, get_roi_area_km2
 
-def run(country_name, roi, year, month):
-    st.markdown(f"""
-        <div style="background-color: #A04000; padding: 20px; border-radius: 15px; text-align: center; border: 2px solid #6E2C00;">
-            <h2 style="color: white; margin: 0;">🔥 Active Wildfires & Thermal Anomalies</h2>
-            <p style="color: #EDBB99; margin: 5px 0 0 0;">
-                FIRMS NRT (MODIS/VIIRS) | Satellite Hotspot Monitoring | {country_name}
-            </p>
-        </div>
-    """, unsafe_allow_html=True)
-
-    # 1. Set Date Range
+# Static page markup, formatted per run with the governorate name only
+_WILDFIRE_BANNER = """
+    <div style="background-color: #A04000; padding: 20px; border-radius: 15px; text-align: center; border: 2px solid #6E2C00;">
+        <h2 style="color: white; margin: 0;">🔥 Active Wildfires & Thermal Anomalies</h2>
+        <p style="color: #EDBB99; margin: 5px 0 0 0;">
+            FIRMS NRT (MODIS/VIIRS) | Satellite Hotspot Monitoring | {country_name}
+        </p>
+    </div>
+"""
+_MAP_FRAME_OPEN = '<div style="border: 3px solid #A04000; border-radius: 15px; overflow: hidden;">'
+
+# Speculative fetches of adjacent months run here, shared by all sessions.
+# In-flight keys prevent submitting the same month twice.
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=4)
+_PREFETCH_IN_FLIGHT = set()
+_PREFETCH_LOCK = threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _firms_collection(country_name, year, month, _roi):
+    # Filtered FIRMS graph per (area, year, month), shared by the count,
+    # the reduction, the map layer and the export
     start_date = ee.Date.fromYMD(year, month, 1)
     end_date = start_date.advance(1, 'month')
-    
-    # 2. Fetch FIRMS Data
     # T21 is the Brightness Temperature of the fire pixel
-    fire_collection = ee.ImageCollection("FIRMS") \
+    return ee.ImageCollection("FIRMS") \
         .filterDate(start_date, end_date) \
-        .filterBounds(roi) \
+        .filterBounds(_roi) \
         .select('T21')
 
-    # Get fire detection count
-    fire_count = fire_collection.size().getInfo()
+@st.cache_resource(show_spinner=False, ttl=3600)
+def _fetch_month(country_name, _roi, year, month, tile_scale):
+    """
+    Runs the Earth Engine side of the wildfire analysis for one month.
+    Performs Earth Engine requests only (no Streamlit calls), so several
+    months can be fetched concurrently (see run_batch). Results are cached per
+    (area, year, month), which lets background prefetches serve later runs.
+    Args:
+        country_name (str): Name of the Jordanian governorate.
+        _roi (ee.FeatureCollection): Region of interest (not hashed).
+        year (int): Year of the analysis.
+        month (int): Month of the analysis.
+        tile_scale (int): tileScale of the peak-temperature reduction.
+    Returns:
+        tuple: (clipped max-temperature ee.Image, {'count', 'stats'} dict).
+    """
+    # FIRMS thermal anomalies for the month
+    fire_collection = _firms_collection(country_name, year, month, _roi)
+
+    # Create composite of maximum temperature. FIRMS pixels are sparse, so
+    # a quality mosaic on T21 picks each pixel's hottest detection without
+    # a full per-image max. The reduction below is bounded by its
+    # geometry, so only the displayed/exported layer is clipped.
+    max_temp_composite = fire_collection.qualityMosaic('T21')
+    max_temp_img = max_temp_composite.clip(_roi)
+
+    # Detection count and maximum temperature in one request; the
+    # reduction is only evaluated when there are detections. The Kelvin to
+    # Celsius conversion is part of the graph, so the payload carries °C.
+    fire_count_ee = fire_collection.size()
+    payload = ee.Dictionary({
+        'count': fire_count_ee,
+        'stats': ee.Algorithms.If(
+            fire_count_ee.gt(0),
+            max_temp_composite.subtract(273.15).rename('T21_C').reduceRegion(
+                reducer=ee.Reducer.max(),
+                geometry=_roi,
+                scale=1000,
+                maxPixels=1e9,
+                tileScale=tile_scale
+            ),
+            ee.Dictionary()
+        )
+    })
+
+    return max_temp_img, payload.getInfo()
+
+def _tile_scale(country_name):
+    # Large governorates are split into more tiles so the reduction runs
+    # across more workers instead of exceeding the per-tile memory limit
+    return 16 if get_roi_area_km2(country_name) > 5000 else 4
+
+def run_batch(country_name, roi, months, tile_scale=None):
+    """
+    Fetches hotspot summaries for several months concurrently. Each month
+    is an independent request, so wall time is close to the slowest one
+    rather than the sum. Results go through the _fetch_month cache, so a
+    later run of any of these months is served without a request.
+    Args:
+        country_name (str): Name of the Jordanian governorate.
+        roi (ee.FeatureCollection): Region of interest.
+        months (list): (year, month) tuples.
+        tile_scale (int, optional): tileScale of the peak-temperature
+            reduction; derived from the governorate area when omitted.
+    Returns:
+        list: One {"Year", "Month", "Hotspots", "Peak (°C)"} dict per month,
+        in input order.
+    """
+    if tile_scale is None:
+        tile_scale = _tile_scale(country_name)
+    with ThreadPoolExecutor(max_workers=min(len(months), 12) or 1) as executor:
+        futures = [executor.submit(_fetch_month, country_name, roi, year, month, tile_scale)
+                   for year, month in months]
+        results = [future.result()[1] for future in futures]
+
+    summaries = []
+    for (year, month), result in zip(months, results):
+        max_c = result['stats'].get('T21_C')
+        summaries.append({
+            "Year": year,
+            "Month": month,
+            "Hotspots": result['count'],
+            "Peak (°C)": round(max_c, 1) if max_c is not None else None
+        })
+    return summaries
+
+def _prefetch_adjacent(country_name, roi, year, month, tile_scale):
+    # Users typically step to the previous or next month, so both are
+    # warmed in the background as one batch; failures are ignored because
+    # a real run of that month will surface them
+    today = datetime.date.today()
+    months = []
+    for offset in (-1, 1):
+        index = year * 12 + (month - 1) + offset
+        adj_year, adj_month = divmod(index, 12)
+        adj_month += 1
+        # Months that have not started yet have no detections to fetch
+        if (adj_year, adj_month) <= (today.year, today.month):
+            months.append((adj_year, adj_month))
+
+    with _PREFETCH_LOCK:
+        months = [m for m in months if (country_name,) + m not in _PREFETCH_IN_FLIGHT]
+        keys = {(country_name,) + m for m in months}
+        _PREFETCH_IN_FLIGHT.update(keys)
+    if not months:
+        return
+
+    def task():
+        try:
+            run_batch(country_name, roi, months, tile_scale)
+        except Exception:
+            pass
+        finally:
+            with _PREFETCH_LOCK:
+                _PREFETCH_IN_FLIGHT.difference_update(keys)
+
+    _PREFETCH_POOL.submit(task)
+
+def run(country_name, roi, year, month):
+    st.markdown(_WILDFIRE_BANNER.format(country_name=country_name), unsafe_allow_html=True)
+
+    # The map center comes from the cached bounds and only costs a
+    # round-trip on first use, so it overlaps with the monthly request
+    tile_scale = _tile_scale(country_name)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        month_future = executor.submit(_fetch_month, country_name, roi, year, month, tile_scale)
+        center_future = executor.submit(get_roi_center, country_name)
+        max_temp_img, result = month_future.result()
+        center = center_future.result()
+
+    fire_count = result['count']
+    stats = result['stats']
     
     # Pre-define variables for the return dictionary
     max_celsius = "N/A"
@@ -38,20 +179,9 @@ def run(country_name, roi, year, month):
         st.metric("Detected Hotspots", f"{fire_count}")
     
     if fire_count > 0:
-        # Create composite of maximum temperature
-        max_temp_img = fire_collection.max().clip(roi)
-        
-        # Calculate Max Temperature in Kelvin and Convert to Celsius
-        stats = max_temp_img.reduceRegion(
-            reducer=ee.Reducer.max(),
-            geometry=roi,
-            scale=1000,
-            maxPixels=1e9
-        ).getInfo()
-        
-        max_k = stats.get('T21')
-        if max_k:
-            max_celsius = f"{(max_k - 273.15):.1f} °C"
+        max_c = stats.get('T21_C')
+        if max_c is not None:
+            max_celsius = f"{max_c:.1f} °C"
         
         with col2:
             st.metric("Peak Fire Temp", max_celsius)
@@ -59,29 +189,50 @@ def run(country_name, roi, year, month):
             st.metric("Sensor", "MODIS/VIIRS")
 
         # 4. Map Display
-        m = geemap.Map()
-        m.add_basemap("HYBRID")
-        
         fire_vis = {
             'min': 300,
             'max': 500,
             'palette': ['#F1C40F', '#E67E22', '#C0392B'] # Yellow to Deep Red
         }
-        
-        m.addLayer(max_temp_img, fire_vis, "Active Fire Hotspots")
-        m.add_colorbar(fire_vis, label="Brightness Temperature (Kelvin)", orientation="horizontal")
-        m.centerObject(roi, 7)
 
-        st.markdown('<div style="border: 3px solid #A04000; border-radius: 15px; overflow: hidden;">', unsafe_allow_html=True)
-        folium_static(m, width=1000)
+        def build_map():
+            m = new_map("HYBRID")
+            # Single-month snapshot at ~1 km: one PNG instead of live tiles
+            add_image_overlay(m, max_temp_img, country_name,
+                              ("wildfire", country_name, year, month),
+                              fire_vis, "Active Fire Hotspots")
+            add_colorbar(m, fire_vis, label="Brightness Temperature (Kelvin)")
+            m.set_center(*center, 7)
+            return m
+
+        st.markdown(_MAP_FRAME_OPEN, unsafe_allow_html=True)
+        display_map(build_map, ("wildfire", country_name, year, month))
         st.markdown('</div>', unsafe_allow_html=True)
 
+        # On-demand GeoTIFF export; the region comes from the cached bounds.
+        # Whole-Kelvin int16 halves the file size versus float32.
+        download_button(
+            max_temp_img.toInt16(),
+            country_name,
+            ("wildfire", country_name, year, month),
+            file_name=f"Wildfire_{country_name}_{year}_{month:02d}",
+            scale=1000,
+            bytes_per_pixel=2
+        )
+
     else:
         st.info(f"No significant thermal anomalies detected in {country_name} for {month}/{year}.")
-        m = geemap.Map()
-        m.add_basemap("HYBRID")
-        m.centerObject(roi, 6)
-        folium_static(m, width=1000)
+
+        def build_empty_map():
+            m = new_map("HYBRID")
+            m.set_center(*center, 6)
+            return m
+
+        # The empty overview only depends on the area
+        display_map(build_empty_map, ("wildfire_empty", country_name))
+
+    # Overlap the user's next navigation with Earth Engine latency
+    _prefetch_adjacent(country_name, roi, year, month, tile_scale)
 
     # --- RETURN DATA FOR PDF REPORT ---
     return {
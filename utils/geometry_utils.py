@@ -1,48 +1,92 @@
+import streamlit as st
 import ee
 
+# Mapping common names to the GAUL name and known alternative spellings.
+# Keys are lowercase so lookups tolerate case/whitespace differences.
+_GAUL_NAMES = {k.lower(): v for k, v in {
+    "Amman": ["Amman"],
+    "Irbid": ["Irbid"],
+    "Zarqa": ["Az Zarqa", "Zarqa", "Al Zarqa"],
+    "Aqaba": ["Al Aqabah", "Aqaba", "Al Aqaba"],
+    "Madaba": ["Madaba"],
+    "Mafraq": ["Al Mafraq", "Mafraq"],
+    "Balqa": ["Al Balqa", "Balqa"],
+    "Jerash": ["Jarash", "Jerash"],
+    "Karak": ["Al Karak", "Karak"],
+    "Ma'an": ["Ma'an", "Maan", "Ma`an"],
+    "Tafilah": ["At Tafilah", "Tafilah", "Tafiela"],
+    "Ajloun": ["Ajlun", "Ajloun"]
+}.items()}
+
+@st.cache_resource(show_spinner=False)
 def get_country_roi(area_name):
     """
     Fetches the geometry for a specific Jordan Governorate (ADM1).
+    The resulting FeatureCollection is memoized per governorate, so reruns
+    skip the lookup. Building it makes no requests; a name matching none of
+    the aliases falls back to the Jordan country outline server-side.
     Args:
         area_name (str): Name of the Jordanian governorate.
     Returns:
         ee.FeatureCollection: The geometry of the selected area.
     """
-    try:
-        # Load the Global Administrative Unit Layers (Level 1 for Governorates)
-        jordan_admin = ee.FeatureCollection("FAO/GAUL/2015/level1") \
-            .filter(ee.Filter.eq('ADM0_NAME', 'Jordan'))
-        
-        # Mapping common names to GAUL names to prevent errors
-        name_mapping = {
-            "Amman": "Amman",
-            "Irbid": "Irbid",
-            "Zarqa": "Az Zarqa",
-            "Aqaba": "Al Aqabah",
-            "Madaba": "Madaba",
-            "Mafraq": "Al Mafraq",
-            "Balqa": "Al Balqa",
-            "Jerash": "Jarash",
-            "Karak": "Al Karak",
-            "Ma'an": "Ma'an",
-            "Tafilah": "At Tafilah",
-            "Ajloun": "Ajlun"
-        }
-        
-        # Use the mapped name if it exists, otherwise use the input name
-        search_name = name_mapping.get(area_name, area_name)
-        
-        # Filter the collection
-        roi = jordan_admin.filter(ee.Filter.eq('ADM1_NAME', search_name))
-        
-        # Check if ROI exists, if not, try a 'contains' search as a safety net
-        if roi.size().getInfo() == 0:
-            roi = jordan_admin.filter(ee.Filter.stringContains('ADM1_NAME', area_name))
-            
-        return roi
-
-    except Exception as e:
-        # Fallback to Jordan Country level if city fails
-        print(f"Error fetching ROI for {area_name}: {e}")
-        return ee.FeatureCollection("USDOS/LSIB_SIMPLE/2017") \
-                 .filter(ee.Filter.eq('country_na', 'Jordan'))
+    # Load the Global Administrative Unit Layers (Level 1 for Governorates)
+    jordan_admin = ee.FeatureCollection("FAO/GAUL/2015/level1") \
+        .filter(ee.Filter.eq('ADM0_NAME', 'Jordan'))
+
+    # Candidate spellings for the governorate, otherwise the input name
+    candidates = _GAUL_NAMES.get(area_name.strip().lower(), [area_name.strip()])
+
+    # A single membership filter over the aliases replaces the
+    # existence check and 'contains' fallback search
+    governorate = jordan_admin.filter(ee.Filter.inList('ADM1_NAME', candidates))
+
+    # Fallback to Jordan Country level if no alias matches, resolved inside
+    # the request graph instead of an empty collection failing downstream
+    country = ee.FeatureCollection("USDOS/LSIB_SIMPLE/2017") \
+        .filter(ee.Filter.eq('country_na', 'Jordan'))
+    return ee.FeatureCollection(
+        ee.Algorithms.If(governorate.limit(1).size().gt(0), governorate, country)
+    )
+
+
+@st.cache_data(show_spinner=False)
+def get_roi_bounds(area_name):
+    """
+    Fetches the bounding box of a governorate once per server process.
+    Governorate boundaries are static, so reruns reuse the cached result
+    instead of issuing a new bounds().getInfo() round-trip.
+    Args:
+        area_name (str): Name of the Jordanian governorate.
+    Returns:
+        list: Bounding box ring as [[lon, lat], ...] coordinates.
+    """
+    roi = get_country_roi(area_name)
+    return roi.geometry().bounds().getInfo()['coordinates'][0]
+
+
+def get_roi_center(area_name):
+    """
+    Computes the center of a governorate from its cached bounding box.
+    Args:
+        area_name (str): Name of the Jordanian governorate.
+    Returns:
+        tuple: (lon, lat) of the bounding box center.
+    """
+    ring = get_roi_bounds(area_name)
+    lons = [point[0] for point in ring]
+    lats = [point[1] for point in ring]
+    return (min(lons) + max(lons)) / 2, (min(lats) + max(lats)) / 2
+
+
+@st.cache_data(show_spinner=False)
+def get_roi_area_km2(area_name):
+    """
+    Fetches the area of a governorate once per server process.
+    Args:
+        area_name (str): Name of the Jordanian governorate.
+    Returns:
+        float: Area in square kilometers.
+    """
+    roi = get_country_roi(area_name)
+    return roi.geometry().area(maxError=100).divide(1e6).getInfo()
@@ -1,7 +1,48 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import ee
 import json
+import math
+import copy
+import folium
+import geemap.foliumap as geemap
+import io
+import re
+import base64
+from folium.plugins import FloatImage
+from matplotlib.figure import Figure
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import LinearSegmentedColormap, Normalize
 from google.oauth2 import service_account
+from utils.geometry_utils import get_roi_bounds
+
+@st.cache_resource(show_spinner=False)
+def _init_gee():
+    # Runs once per server process: reruns reuse the initialized session
+    # instead of re-parsing the secret and repeating the handshake.
+    # Failures raise and are therefore not cached.
+
+    # Convert the JSON string into a Python dictionary
+    info = json.loads(st.secrets["GEE_JSON"], strict=False)
+    
+    # Define the required scope for accessing Earth Engine resources
+    # This explicitly resolves the invalid_scope issue
+    scopes = ['https://www.googleapis.com/auth/earthengine']
+    
+    # Create service account credentials with the specified scope
+    credentials = service_account.Credentials.from_service_account_info(
+        info, scopes=scopes
+    )
+    
+    # Initialize Earth Engine with the authenticated credentials.
+    # The high-volume endpoint tolerates more concurrent
+    # reduceRegion/classify requests than the default one.
+    ee.Initialize(
+        credentials=credentials,
+        opt_url='https://earthengine-highvolume.googleapis.com'
+    )
+    return True
+
 
 def authenticate_gee():
     """
@@ -10,22 +51,7 @@ def authenticate_gee():
     """
     if "GEE_JSON" in st.secrets:
         try:
-            # Convert the JSON string into a Python dictionary
-            info = json.loads(st.secrets["GEE_JSON"], strict=False)
-            
-            # Define the required scope for accessing Earth Engine resources
-            # This explicitly resolves the invalid_scope issue
-            scopes = ['https://www.googleapis.com/auth/earthengine']
-            
-            # Create service account credentials with the specified scope
-            credentials = service_account.Credentials.from_service_account_info(
-                info, scopes=scopes
-            )
-            
-            # Initialize Earth Engine with the authenticated credentials
-            ee.Initialize(credentials=credentials)
-            
-            return True
+            return _init_gee()
         
         except Exception as e:
             st.error(f"❌ Failed to connect to Google Earth Engine: {e}")
@@ -33,3 +59,192 @@ def authenticate_gee():
     else:
         st.error("❌ GEE_JSON was not found in Streamlit Secrets configuration.")
         return False
+
+
+@st.cache_resource(show_spinner=False, ttl=3600)
+def _render_map_html(cache_key, _build_map):
+    # The builder is excluded from hashing (leading underscore); the key
+    # alone identifies the map content. cache_resource shares the HTML
+    # across sessions without copying it on every hit.
+    return _build_map().get_root().render()
+
+
+def display_map(build_map, cache_key, width=1000, height=500):
+    """
+    Renders a folium/geemap map once per cache key and reuses the HTML on
+    subsequent Streamlit reruns instead of re-rendering it every time.
+    Args:
+        build_map (callable): Zero-argument function returning the map.
+        cache_key (tuple): Inputs that fully determine the map content.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+    """
+    html = _render_map_html(cache_key, build_map)
+    components.html(html, width=width, height=height + 10)
+
+
+@st.cache_resource(show_spinner=False)
+def _base_map_template(basemap):
+    # Basemap skeleton built once per server process; callers get copies
+    m = geemap.Map()
+    m.add_basemap(basemap)
+    return m
+
+
+def new_map(basemap):
+    """
+    Returns a fresh map with the given basemap, copied from a cached
+    template instead of rebuilding the basemap layers on every map build.
+    Args:
+        basemap (str): geemap basemap name (e.g. "HYBRID", "SATELLITE").
+    Returns:
+        geemap.Map: Independent map ready for per-analysis layers.
+    """
+    return copy.deepcopy(_base_map_template(basemap))
+
+
+@st.cache_resource(show_spinner=False)
+def _colorbar_png(palette, vmin, vmax, label):
+    # Rendered once per (palette, range, label) and shared by all maps.
+    # Figure is used directly (no pyplot), so this is safe across threads.
+    fig = Figure(figsize=(6, 0.9))
+    ax = fig.add_axes([0.05, 0.55, 0.9, 0.3])
+    cmap = LinearSegmentedColormap.from_list('palette', list(palette))
+    colorbar = fig.colorbar(ScalarMappable(norm=Normalize(vmin, vmax), cmap=cmap),
+                            cax=ax, orientation='horizontal')
+    colorbar.set_label(label)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=100, transparent=True)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def add_colorbar(m, vis_params, label):
+    """
+    Adds a horizontal colorbar to a map as a pre-rendered PNG, instead of
+    drawing a new matplotlib figure for every map build.
+    Args:
+        m (geemap.Map): Map to add the colorbar to.
+        vis_params (dict): Visualization parameters (min, max, palette).
+        label (str): Colorbar caption.
+    """
+    # Earth Engine palettes may omit the leading '#' on hex colors
+    palette = tuple(
+        f"#{c}" if re.fullmatch(r'[0-9a-fA-F]{6}', c) else c
+        for c in vis_params['palette']
+    )
+    png = _colorbar_png(palette, vis_params['min'], vis_params['max'], label)
+    FloatImage(f"data:image/png;base64,{png}", bottom=2, left=2).add_to(m)
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def _thumb_url(cache_key, area_name, vis_params, dimensions, _image):
+    params = dict(vis_params)
+    params.update({
+        # Planar lat/lon rectangle, matching the ImageOverlay bounds exactly
+        # (a geodesic polygon's edges bow outward in Web Mercator)
+        'region': ee.Geometry.Polygon([get_roi_bounds(area_name)], None, False),
+        'dimensions': dimensions,
+        # Web Mercator matches Leaflet, so the PNG stretches without distortion
+        'crs': 'EPSG:3857',
+        'format': 'png'
+    })
+    return _image.getThumbURL(params)
+
+
+def add_image_overlay(m, image, area_name, cache_key, vis_params, name, dimensions=1024):
+    """
+    Adds an Earth Engine image to a map as one pre-rendered PNG instead of
+    a live tile layer, so panning and zooming never go back to Earth Engine
+    to recompute the lazy image.
+    Args:
+        m (geemap.Map): Map to add the overlay to.
+        image (ee.Image): Image to render.
+        area_name (str): Governorate whose bounding box is rendered.
+        cache_key (tuple): Inputs that fully determine the image content.
+        vis_params (dict): Visualization parameters (min, max, palette).
+        name (str): Layer name shown in the layer control.
+        dimensions (int): Size of the longer image edge in pixels.
+    """
+    url = _thumb_url(cache_key, area_name, vis_params, dimensions, image)
+    ring = get_roi_bounds(area_name)
+    lons = [point[0] for point in ring]
+    lats = [point[1] for point in ring]
+    folium.raster_layers.ImageOverlay(
+        image=url,
+        bounds=[[min(lats), min(lons)], [max(lats), max(lons)]],
+        name=name
+    ).add_to(m)
+
+
+# getDownloadURL rejects requests above 48 MiB
+_DOWNLOAD_LIMIT_BYTES = 50331648
+# Headroom for GeoTIFF overhead and pixels on the bbox edges
+_DOWNLOAD_BUDGET = 0.8 * _DOWNLOAD_LIMIT_BYTES
+_MAX_SIZE_RETRIES = 3
+
+
+def _fit_download_scale(area_name, scale, bytes_per_pixel):
+    # Smallest scale (rounded up to 10 m) at which the governorate bbox
+    # fits the download budget, estimated from the cached bounds
+    ring = get_roi_bounds(area_name)
+    lons = [point[0] for point in ring]
+    lats = [point[1] for point in ring]
+    mid_lat = math.radians((min(lats) + max(lats)) / 2)
+    width_m = (max(lons) - min(lons)) * 111320 * math.cos(mid_lat)
+    height_m = (max(lats) - min(lats)) * 110540
+    min_scale = math.sqrt(width_m * height_m * bytes_per_pixel / _DOWNLOAD_BUDGET)
+    return max(scale, int(math.ceil(min_scale / 10) * 10))
+
+
+def _is_size_error(error):
+    # Earth Engine reports "Total request size (...) must be less than or
+    # equal to 50331648 bytes"
+    return 'request size' in str(error).lower()
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def _download_url(cache_key, area_name, file_name, scale, _image):
+    region = ee.Geometry.Polygon([get_roi_bounds(area_name)])
+    return _image.getDownloadURL({
+        'name': file_name,
+        'scale': scale,
+        'region': region,
+        'format': 'GEO_TIFF'
+    })
+
+
+@st.fragment
+def download_button(image, area_name, cache_key, file_name, scale, bytes_per_pixel=4):
+    """
+    Offers a GeoTIFF export that is only materialized when requested.
+    Runs as a fragment so the button click does not rerun the whole app,
+    and caches the generated URL per cache key. The resolution is coarsened
+    when the governorate would exceed the direct download size limit.
+    Args:
+        image (ee.Image): Image to export.
+        area_name (str): Governorate whose bounding box is exported.
+        cache_key (tuple): Inputs that fully determine the image content.
+        file_name (str): Name of the downloaded file (without extension).
+        scale (int): Requested export resolution in meters.
+        bytes_per_pixel (int): Size of one pixel across all bands
+            (4 for a float32 band, 2 for int16, 1 for a byte mask).
+    """
+    widget_key = "dl_" + "_".join(str(part) for part in cache_key)
+    if st.button("📦 Prepare GeoTIFF Download", key=widget_key):
+        export_scale = _fit_download_scale(area_name, scale, bytes_per_pixel)
+        with st.spinner("Preparing GeoTIFF export..."):
+            for attempt in range(_MAX_SIZE_RETRIES + 1):
+                try:
+                    url = _download_url(cache_key, area_name, file_name, export_scale, image)
+                    break
+                except ee.EEException as e:
+                    # The bbox estimate can still be short (e.g. reprojection);
+                    # only size errors are retried at a coarser resolution
+                    if not _is_size_error(e) or attempt == _MAX_SIZE_RETRIES:
+                        st.error(f"GeoTIFF export failed: {e}")
+                        return
+                    export_scale *= 2
+
+        if export_scale != scale:
+            st.caption(f"Exported at {export_scale} m to stay within the download size limit.")
+        st.link_button("📥 Download GeoTIFF", url)